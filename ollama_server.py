@@ -1,21 +1,35 @@
-import requests
-from requests.exceptions import RequestException
-from bs4 import BeautifulSoup
-from html2text import html2text
+import asyncio
+import concurrent.futures
+import hashlib
+import multiprocessing
+import re
+import tempfile
+from typing import Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache
+from diskcache import Cache
+from tenacity import retry, retry_if_exception, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+from selectolax.lexbor import LexborHTMLParser
 
 import uvicorn
 from starlette.applications import Starlette
 from starlette.requests import Request
 from starlette.routing import Route, Mount
 
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 from mcp.shared.exceptions import McpError
 from mcp.types import ErrorData, INTERNAL_ERROR, INVALID_PARAMS
 from mcp.server.sse import SseServerTransport
 
 # Import Google Generative AI client library
 import google.generativeai as genai
+from google.api_core import exceptions as gexc
+from google.generativeai.types import GenerationConfig
 import os # To access environment variables
+import sys
 
 # --- IMPORTANT: Configure your Gemini API Key ---
 # It's recommended to store your API key as an environment variable
@@ -25,88 +39,342 @@ import os # To access environment variables
 # ------------------------------------------------
 
 # Configure the genai library with your API key
-try:
-    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
-except KeyError:
-    print("Error: GOOGLE_API_KEY environment variable not set.")
-    print("Please set the GOOGLE_API_KEY environment variable or uncomment the line above to set it directly (for testing only).")
-    exit(1) # Exit if API key is not found
+api_key = os.environ.get("GOOGLE_API_KEY")
+if not api_key:
+    # Exit if API key is not found
+    sys.exit(
+        "Error: GOOGLE_API_KEY environment variable not set.\n"
+        "Please set the GOOGLE_API_KEY environment variable or uncomment the line above to set it directly (for testing only)."
+    )
+genai.configure(api_key=api_key)
 
 # Initialize the Gemini model
 # You can choose a different model if needed, e.g., 'gemini-pro', 'gemini-1.5-pro-latest'
 GEMINI_MODEL = genai.GenerativeModel('gemini-2.0-flash')
 
+# Generation settings built once and shared by every call; capping the output length
+# bounds both tail latency and cost
+GEN_CFG = GenerationConfig(max_output_tokens=512, temperature=0.2, top_p=0.9, candidate_count=1)
+
+# Gemini quotas for the model, overridable for higher-tier projects
+GEMINI_RPM = int(os.environ.get("GEMINI_RPM", "15"))
+GEMINI_TPM = int(os.environ.get("GEMINI_TPM", "1000000"))
+
+# Token-bucket limiters that pace Gemini calls ahead of time instead of waiting out 429s
+RPM_LIMITER = AsyncLimiter(max_rate=GEMINI_RPM, time_period=60)
+TPM_LIMITER = AsyncLimiter(max_rate=GEMINI_TPM, time_period=60)
+
+# Shared async HTTP client so connections to Wikipedia are pooled and reused across tool calls
+ASYNC_HTTP = httpx.AsyncClient(
+    headers={"User-Agent": "wiki-summary-gemini/1.0 (MCP Wikipedia summarizer)"},
+    timeout=httpx.Timeout(10.0, connect=3.0),
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+    transport=httpx.AsyncHTTPTransport(retries=3),
+    follow_redirects=True,
+)
+
+# Wikipedia statuses worth retrying with backoff (rate limiting and transient server errors)
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Upper bound on article characters sent to Gemini, to keep prompt size and latency bounded
+MAX_ARTICLE_CHARS = 120_000
+# Upper bound on (decompressed) article bytes buffered per request, to bound memory under concurrency
+MAX_ARTICLE_BYTES = 4 << 20
+# Markup that follows #mw-content-text on Wikipedia pages; nothing after it is needed
+_CONTENT_END_MARKERS = (b'class="printfooter"', b'id="catlinks"')
+
+# Summarization prompt around the article text. It's good practice to make prompts clear
+# for LLMs; editing these changes the prompt-cache key, so old summaries are not reused
+_PROMPT_PREFIX = (
+    "Please summarize the following Wikipedia article text concisely and accurately. "
+    "Focus on the main points and key information:\n\nArticle Text:\n"
+)
+_PROMPT_SUFFIX = "\n\nSummary:"
+
+# Collapses runs of whitespace left between inline elements
+_WS_RE = re.compile(r"\s+")
+# Elements removed from the article before text is taken from the remaining blocks
+_NOISE_SELECTORS = (
+    "sup.reference",
+    "table.infobox",
+    "table.navbox",
+    "div.navbox",
+    "div.hatnote",
+    "ol.references",
+    "span.mw-editsection",
+    "style",
+)
+_BLOCK_SELECTOR = "p, h2, h3"
+
+# Worker processes for HTML extraction, so parsing large pages does not hold the GIL
+# on the event loop thread; created on first use
+_EXTRACT_EXECUTOR: Optional[concurrent.futures.ProcessPoolExecutor] = None
+# Workers are started from a clean process rather than forked from the running server,
+# which would hand them copies of its listening and client sockets
+_EXTRACT_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Summaries keyed on normalized URL, so repeat requests skip the Wikipedia fetch and Gemini call
+SUMMARY_CACHE = TTLCache(maxsize=512, ttl=3600)
+# Summaries currently being generated, so concurrent calls for the same URL share one task
+_IN_FLIGHT: Dict[str, asyncio.Task] = {}
+
+# Summaries keyed on a hash of the model, generation settings and prompt, persisted across server restarts;
+# catches different URLs (redirects, mirrors) that resolve to the same article text
+PROMPT_CACHE = Cache(
+    os.environ.get("GEMINI_CACHE_DIR", os.path.join(tempfile.gettempdir(), "gemini_cache")),
+    size_limit=1 << 30,
+)
+
 # Create an MCP server instance with the identifier "wiki-summary-gemini"
 mcp = FastMCP("wiki-summary-gemini")
 
+def estimate_tokens(text: str) -> int:
+    """
+    Rough local token estimate (about four characters per token) for TPM accounting.
+    """
+    return max(1, len(text) // 4)
+
+async def count_prompt_tokens(prompt: str) -> int:
+    """
+    Token count for TPM accounting. The local estimate is used unless it comes
+    within 10% of the per-minute budget, where an overestimate would stall the
+    limiter (or exceed its capacity), so only then is Gemini's tokenizer called.
+    """
+    estimate = estimate_tokens(prompt)
+    if estimate <= 0.9 * GEMINI_TPM:
+        return estimate
+    counted = await GEMINI_MODEL.count_tokens_async(prompt)
+    return max(1, counted.total_tokens)
+
+@retry(
+    retry=retry_if_exception_type(gexc.ResourceExhausted),
+    wait=wait_exponential_jitter(1, 30),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+async def _generate_summary(prompt: str, tokens: int):
+    # The limiters are the first line of defense; the retry covers quota we could not predict.
+    # Quota errors surface when the stream is opened, so retrying here never duplicates chunks.
+    async with RPM_LIMITER:
+        await TPM_LIMITER.acquire(min(tokens, GEMINI_TPM))
+        return await GEMINI_MODEL.generate_content_async(prompt, generation_config=GEN_CFG, stream=True)
+
+def _is_retryable_status(e: BaseException) -> bool:
+    return isinstance(e, httpx.HTTPStatusError) and e.response.status_code in RETRY_STATUSES
+
+@retry(
+    retry=retry_if_exception(_is_retryable_status),
+    wait=wait_exponential_jitter(0.3, 5),
+    stop=stop_after_attempt(4),
+    reraise=True,
+)
+async def _fetch_article_html(url: str) -> bytes:
+    """
+    Stream the article (gzip-encoded on the wire, which httpx requests by
+    default) and buffer it only up to the end of the main content, or
+    MAX_ARTICLE_BYTES, whichever comes first. Responses with a status in
+    RETRY_STATUSES are retried with backoff; connection failures are retried
+    by the client's transport.
+    """
+    buf = bytearray()
+    complete = False
+    async with ASYNC_HTTP.stream("GET", url) as response:
+        if response.status_code in RETRY_STATUSES:
+            raise httpx.HTTPStatusError(
+                f"Transient HTTP status {response.status_code} from Wikipedia",
+                request=response.request,
+                response=response,
+            )
+        if response.status_code != 200:
+            raise McpError(
+                ErrorData(
+                    code=INTERNAL_ERROR,
+                    message=f"Failed to retrieve the article. HTTP status code: {response.status_code}",
+                )
+            )
+        async for chunk in response.aiter_bytes(65536):
+            if complete:
+                # Read but don't buffer the page footer, so the connection can go back to the pool
+                continue
+            # Start the search a little before the new chunk in case a marker spans two chunks
+            scan_from = max(0, len(buf) - 32)
+            buf.extend(chunk)
+            if len(buf) >= MAX_ARTICLE_BYTES:
+                break
+            complete = any(buf.find(marker, scan_from) != -1 for marker in _CONTENT_END_MARKERS)
+    return bytes(buf)
+
+def _extract_article_text(html: bytes) -> Optional[str]:
+    """
+    Extract the paragraph and heading text of the article's main content, one
+    block per line, or return None if the page has no #mw-content-text div.
+    Known noise (references, infoboxes, navboxes, hatnotes, edit links) is
+    dropped first, including any paragraphs nested inside it.
+    """
+    content_div = LexborHTMLParser(html).css_first("div#mw-content-text")
+    if content_div is None:
+        return None
+    root = content_div.css_first("div.mw-parser-output")
+    if root is None:
+        root = content_div
+
+    for css in _NOISE_SELECTORS:
+        for node in root.css(css):
+            node.decompose()
+
+    blocks = (_WS_RE.sub(" ", node.text()).strip() for node in root.css(_BLOCK_SELECTOR))
+    text = "\n".join(block for block in blocks if block)
+    # Pages without paragraph markup (e.g. lists) still get their visible text
+    return text or _WS_RE.sub(" ", root.text()).strip()
+
+async def _extract_article_text_async(html: bytes) -> Optional[str]:
+    """
+    Run _extract_article_text in a worker process and await the result.
+    """
+    global _EXTRACT_EXECUTOR
+    if _EXTRACT_EXECUTOR is None:
+        _EXTRACT_EXECUTOR = concurrent.futures.ProcessPoolExecutor(
+            max_workers=os.cpu_count(),
+            mp_context=multiprocessing.get_context(_EXTRACT_START_METHOD),
+        )
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_EXTRACT_EXECUTOR, _extract_article_text, html)
+
+async def _report_chunk(ctx: Context, progress: int, text: str) -> bool:
+    """
+    Send a chunk of summary text as a progress notification. This is best
+    effort: the summarization is shared by every caller of the URL, so a
+    notification failing because the originating caller disconnected must not
+    fail it. Returns False once a notification could not be delivered.
+    """
+    try:
+        await ctx.report_progress(progress, message=text)
+        return True
+    except Exception as e:
+        print(f"Progress notification failed, continuing without streaming: {e}")
+        return False
+
+def _prompt_key(prompt: str) -> str:
+    # The model and generation settings are part of the key, so changing either invalidates old summaries
+    return hashlib.sha256(f"{GEMINI_MODEL.model_name}\n{GEN_CFG!r}\n{prompt}".encode()).hexdigest()
+
+def _cache_key(url: str) -> str:
+    """
+    Normalize a URL for caching. Only the scheme and host are lowercased,
+    since Wikipedia article titles in the path are case-sensitive.
+    """
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, ""))
+
+def _on_summary_done(key: str, task: asyncio.Task) -> None:
+    # Only successful summaries are cached; failures are retried on the next call
+    _IN_FLIGHT.pop(key, None)
+    if not task.cancelled() and task.exception() is None:
+        SUMMARY_CACHE[key] = task.result()
+
 @mcp.tool()
-def summarize_wikipedia_article(url: str) -> str:
+async def summarize_wikipedia_article(url: str, ctx: Context) -> str:
     """
-    Fetch a Wikipedia article at the provided URL, parse its main content,
-    convert it to Markdown, and generate a summary using the Gemini model.
+    Fetch a Wikipedia article at the provided URL, extract the visible text of
+    its main content, and generate a summary using the Gemini model.
+    Summary text is streamed to the caller as progress notifications while it
+    is generated, and the full summary is returned at the end.
 
     Usage:
         summarize_wikipedia_article("https://en.wikipedia.org/wiki/Python_(programming_language)")
     """
+    key = _cache_key(url)
+    if key in SUMMARY_CACHE:
+        return SUMMARY_CACHE[key]
+
+    # Join an in-flight summarization of the same URL instead of starting another one
+    task = _IN_FLIGHT.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_and_summarize(url, ctx))
+        _IN_FLIGHT[key] = task
+        task.add_done_callback(lambda t: _on_summary_done(key, t))
+
+    # Callers that join an in-flight task receive only the final summary, not the stream
+    # Shield the shared task so one cancelled caller does not cancel it for the others
+    return await asyncio.shield(task)
+
+async def _fetch_and_summarize(url: str, ctx: Context) -> str:
+    """
+    Fetch the article and summarize it with Gemini, bypassing the cache.
+    """
     try:
         # Validate input
         if not url.startswith("http"):
             raise ValueError("URL must start with http or https.")
 
         # Fetch the article
-        response = requests.get(url, timeout=10)
-        if response.status_code != 200:
+        html = await _fetch_article_html(url)
+
+        # Extract the visible text of the main content; Gemini does not need Markdown to summarize
+        article_text = await _extract_article_text_async(html)
+        if article_text is None:
             raise McpError(
                 ErrorData(
-                    INTERNAL_ERROR,
-                    f"Failed to retrieve the article. HTTP status code: {response.status_code}"
+                    code=INVALID_PARAMS,
+                    message="Could not find the main content on the provided Wikipedia URL.",
                 )
             )
+        article_text = article_text[:MAX_ARTICLE_CHARS]
 
-        # Parse the main content of the article
-        soup = BeautifulSoup(response.text, "html.parser")
-        content_div = soup.find("div", {"id": "mw-content-text"})
-        if not content_div:
+        # Create the summarization prompt for Gemini
+        prompt = "".join((_PROMPT_PREFIX, article_text, _PROMPT_SUFFIX))
+
+        # Skip Gemini when this exact prompt has already been summarized
+        prompt_key = _prompt_key(prompt)
+        cached_summary = PROMPT_CACHE.get(prompt_key)
+        if cached_summary is not None:
+            await _report_chunk(ctx, 1, cached_summary)
+            return cached_summary
+
+        # Call the Gemini model to generate a summary, paced by the RPM/TPM limiters
+        # The response is streamed so the caller sees text as soon as the first chunk arrives
+        # Counted once per request, so retries reuse it rather than calling the tokenizer again
+        prompt_tokens = await count_prompt_tokens(prompt)
+        gemini_response = await _generate_summary(prompt, prompt_tokens)
+
+        chunk_count = 0
+        streaming = True
+        async for chunk in gemini_response:
+            # Chunks without candidates (a blocked prompt) or parts (e.g. the final metadata
+            # chunk) carry no text; `.parts` itself raises when there are no candidates
+            if chunk.candidates and chunk.parts:
+                chunk_count += 1
+                if streaming:
+                    streaming = await _report_chunk(ctx, chunk_count, chunk.text)
+
+        # Once the stream is consumed, `.text` joins the text of every part of the response
+        try:
+            summary = (gemini_response.text or "").strip()
+        except ValueError:
+            # `.text` raises when there is no text candidate, e.g. the prompt was blocked
+            summary = ""
+        if not summary:
             raise McpError(
                 ErrorData(
-                    INVALID_PARAMS,
-                    "Could not find the main content on the provided Wikipedia URL."
+                    code=INTERNAL_ERROR,
+                    message=f"Gemini model did not return a valid text summary. Prompt feedback: {gemini_response.prompt_feedback}",
                 )
             )
 
-        # Convert the content to Markdown
-        markdown_text = html2text(str(content_div))
-
-        # Create the summarization prompt for Gemini
-        # It's good practice to make prompts clear for LLMs
-        prompt = f"Please summarize the following Wikipedia article text concisely and accurately. Focus on the main points and key information:\n\nArticle Text:\n{markdown_text}\n\nSummary:"
-
-        # Call the Gemini model to generate a summary
-        # The `generate_content` method is used for text generation
-        # `stream=True` is good for real-time output but for a single summary, `stream=False` is fine too.
-        # Here we use the non-streaming approach for simplicity.
-        gemini_response = GEMINI_MODEL.generate_content(prompt)
-        
-        # Access the generated text
-        # Check if there are parts and if the text attribute exists
-        if gemini_response.parts and hasattr(gemini_response.parts[0], 'text'):
-            summary = gemini_response.parts[0].text.strip()
-        else:
-            # Handle cases where the response might not contain text directly
-            # This can happen if the model refuses or if there's an error
-            print(f"Gemini response structure unexpected: {gemini_response}")
-            raise McpError(ErrorData(INTERNAL_ERROR, "Gemini model did not return a valid text summary."))
-
+        PROMPT_CACHE.set(prompt_key, summary)
         return summary
 
+    except McpError:
+        # Already carries the right error code; don't rewrap it as "Unexpected error"
+        raise
     except ValueError as e:
-        raise McpError(ErrorData(INVALID_PARAMS, str(e))) from e
-    except RequestException as e:
-        raise McpError(ErrorData(INTERNAL_ERROR, f"Request error: {str(e)}")) from e
-    except genai.APIError as e: # Catch specific Gemini API errors
-        raise McpError(ErrorData(INTERNAL_ERROR, f"Gemini API error: {str(e)}")) from e
+        raise McpError(ErrorData(code=INVALID_PARAMS, message=str(e))) from e
+    except httpx.HTTPError as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Request error: {str(e)}")) from e
+    except gexc.GoogleAPIError as e: # Catch specific Gemini API errors
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Gemini API error: {str(e)}")) from e
     except Exception as e:
-        raise McpError(ErrorData(INTERNAL_ERROR, f"Unexpected error: {str(e)}")) from e
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Unexpected error: {str(e)}")) from e
 
 # Set up the SSE transport for MCP communication.
 sse = SseServerTransport("/messages/")
@@ -130,4 +398,16 @@ app = Starlette(
 )
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="localhost", port=8000)
\ No newline at end of file
+    # An SSE session lives in the worker that opened it, and uvicorn does not route a
+    # client's /messages/ posts back to that worker, so more than one worker is only
+    # safe behind a proxy with sticky sessions. Caches and rate limits are also per worker.
+    workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+    uvicorn.run(
+        # Multiple workers need an import string so each process can load the app itself
+        "ollama_server:app" if workers > 1 else app,
+        host=os.environ.get("HOST", "localhost"),
+        port=int(os.environ.get("PORT", "8000")),
+        loop="asyncio" if sys.platform == "win32" else "uvloop", # uvloop is not available on Windows
+        http="httptools",
+        workers=workers,
+    )
\ No newline at end of file
@@ -1,9 +1,17 @@
 import streamlit as st
 import asyncio
-import traceback
+import concurrent.futures
+import math
+import queue
+import threading
+import time
+import anyio
 from mcp import ClientSession
 from mcp.client.sse import sse_client
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
 import httpx # Required for sse_client for async HTTP requests
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 # --- Configuration ---
 # Your deployed Cloud Run server URL (base URL for the service)
@@ -13,56 +21,354 @@ CLOUD_RUN_BASE_URL = "https://ollama-gemini-server-974800203413.us-central1.run.
 MCP_SERVER_SSE_URL = f"{CLOUD_RUN_BASE_URL}/sse"
 # The endpoint for posting messages to the MCP server
 MCP_SERVER_MESSAGES_URL = f"{CLOUD_RUN_BASE_URL}/messages/"
+# Seconds to wait for a summary before giving up on the tool call
+TOOL_CALL_TIMEOUT = 60
+# Upper bound on tool calls in flight at once when summarizing several articles
+MAX_CONCURRENT_CALLS = 16
+# How long, in seconds, and how many summaries the app keeps to answer repeat requests
+SUMMARY_CACHE_TTL = 3600
+SUMMARY_CACHE_SIZE = 512
 
-async def call_tool(server_sse_url: str, article_url: str) -> str:
+@st.cache_resource
+def get_loop() -> asyncio.AbstractEventLoop:
     """
-    Connects to the MCP server using SSE, initializes the session,
-    calls the summarize_wikipedia_article tool, and returns only the summary text.
+    Start one asyncio loop in a daemon thread and reuse it for every rerun,
+    instead of creating and tearing down a loop per click with asyncio.run.
     """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True, name="mcp-client-loop").start()
+    return loop
+
+class SummaryCache:
+    """
+    Plain-text summaries shared across sessions and reruns, keyed on URL, with
+    a TTL and a size bound (oldest entry evicted first).
+
+    st.cache_data is not used here: it records every Streamlit element call
+    made while the cached function runs, including the streamed placeholder
+    updates, and replaying those against a placeholder from an earlier run
+    fails on cache hits.
+    """
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, article_url: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(article_url)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] >= self.ttl:
+                del self._entries[article_url]
+                return None
+            return entry[1]
+
+    def set(self, article_url: str, summary: str) -> None:
+        with self._lock:
+            self._entries.pop(article_url, None)
+            self._entries[article_url] = (time.monotonic(), summary)
+            while len(self._entries) > self.maxsize:
+                del self._entries[next(iter(self._entries))]
+
+@st.cache_resource
+def get_summary_cache() -> SummaryCache:
+    return SummaryCache(SUMMARY_CACHE_TTL, SUMMARY_CACHE_SIZE)
+
+class _RelayStream(anyio.abc.ObjectReceiveStream):
+    """
+    Receive side of McpConnection's relay, handed to the ClientSession. Sets
+    closed once the session's receive loop has finished with it, which is after
+    every pending request has been failed with CONNECTION_CLOSED.
+    """
+
+    def __init__(self, stream: anyio.abc.ObjectReceiveStream, closed: asyncio.Event):
+        self._stream = stream
+        self._closed = closed
+
+    async def receive(self):
+        return await self._stream.receive()
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+        self._closed.set()
+
+class McpConnection:
+    """
+    A long-lived MCP client session shared across Streamlit reruns.
+
+    The SSE connection and ClientSession live on the shared background loop
+    from get_loop(), owned by a single task for their whole lifetime (the
+    mcp/anyio context managers must be entered and exited from the same task).
+    Messages from the server are relayed to the session through a forwarding
+    stream, so the connection notices when the server ends the SSE stream (e.g.
+    a Cloud Run request timeout): calls still in flight fail with
+    CONNECTION_CLOSED, and the next call reconnects.
+    """
+
+    def __init__(self, server_sse_url: str, loop: asyncio.AbstractEventLoop):
+        self.server_sse_url = server_sse_url
+        self.loop = loop
+        self.session: Optional[ClientSession] = None
+        self._owner: Optional[asyncio.Task] = None
+        self._closed: Optional[asyncio.Event] = None
+        self._ended: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedule a coroutine on the connection's event loop."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _hold_session(self, ready: asyncio.Future, closed: asyncio.Event, ended: asyncio.Event) -> None:
+        session = None
+        try:
+            async with sse_client(self.server_sse_url) as (reader, writer):
+                relay_writer, relay_reader = anyio.create_memory_object_stream(0)
+                drained = asyncio.Event()
+                stop_relay = anyio.CancelScope()
+
+                async def relay() -> None:
+                    try:
+                        with stop_relay:
+                            async for message in reader:
+                                await relay_writer.send(message)
+                    except Exception:
+                        pass  # A broken stream ends the session the same way as a closed one
+                    finally:
+                        # Mark the session dead before closing the relay, so no new call picks it up.
+                        # Closing it ends the session's receive loop, which fails the calls still
+                        # waiting for a response with CONNECTION_CLOSED
+                        ended.set()
+                        relay_writer.close()
+
+                async with anyio.create_task_group() as tg:
+                    tg.start_soon(relay)
+                    async with ClientSession(_RelayStream(relay_reader, drained), writer) as session:
+                        await session.initialize()
+                        self.session = session
+                        ready.set_result(session)
+                        await closed.wait()
+                        # Exiting the session cancels its receive loop, so let it fail the pending calls first
+                        stop_relay.cancel()
+                        await drained.wait()
+                    tg.cancel_scope.cancel()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+        finally:
+            if not ready.done():
+                ready.set_exception(ConnectionError("MCP server closed the connection during initialization."))
+            if self.session is session:
+                self.session = None
+
+    def is_alive(self) -> bool:
+        """Whether the shared session is open and its SSE stream has not ended."""
+        return (
+            self.session is not None
+            and self._owner is not None
+            and not self._owner.done()
+            and not self._closed.is_set()
+            and not self._ended.is_set()
+        )
+
+    async def get_session(self) -> ClientSession:
+        """Return the shared session, connecting first if it is not open."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.is_alive():
+                # Let a closing owner finish before starting its replacement
+                await self.reset()
+                self._closed = asyncio.Event()
+                self._ended = asyncio.Event()
+                ready = self.loop.create_future()
+                self._owner = asyncio.create_task(self._hold_session(ready, self._closed, self._ended))
+                await ready
+            return self.session
+
+    async def reset(self, stale: Optional[ClientSession] = None) -> None:
+        """
+        Close the current session so the next call reconnects. If stale is
+        given and has already been replaced (or a replacement is connecting),
+        nothing is closed, so concurrent callers recovering from the same drop
+        reconnect only once.
+        """
+        if stale is not None and self.session is not stale:
+            return
+        owner, closed = self._owner, self._closed
+        if closed is not None:
+            closed.set()
+        if owner is not None:
+            await asyncio.gather(owner, return_exceptions=True)
+        # A replacement may have been started while this one was closing
+        if self._owner is owner:
+            self._owner = None
+
+@st.cache_resource
+def get_connection(server_sse_url: str) -> McpConnection:
+    return McpConnection(server_sse_url, get_loop())
+
+def _is_connection_lost(e: Exception) -> bool:
+    if isinstance(e, McpError):
+        return e.error.code == CONNECTION_CLOSED
+    return isinstance(e, (ConnectionError, anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream))
+
+async def call_tool(connection: McpConnection, article_url: str, on_text: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Calls the summarize_wikipedia_article tool over the shared MCP session
+    and returns only the summary text. If on_text is given, it is called with
+    each chunk of summary text the server streams back as a progress notification.
+    """
+    async def on_progress(progress: float, total: Optional[float], message: Optional[str]) -> None:
+        if on_text is not None and message:
+            on_text(message)
+
     try:
-        # Corrected sse_client usage: It typically expects the base URL as the first argument.
-        # The ClientSession then handles the read/write streams internally using this base URL.
-        async with sse_client(server_sse_url) as streams:
-            reader, writer = streams # Unpack the reader and writer streams
-            async with ClientSession(reader, writer) as session:
-                await session.initialize()
-                
-                st.info(f"Calling tool 'summarize_wikipedia_article' for URL: {article_url}")
-                raw_result = await session.call_tool("summarize_wikipedia_article", arguments={"url": article_url})
-                st.success("Tool call completed. Processing result...")
-
-                # --- Logic to Extract Plain Text from MCP Result ---
-                extracted_text = ""
-                
-                # Case 1: Result is a dictionary with a 'content' list (common for Gemini tool output)
-                if isinstance(raw_result, dict) and 'content' in raw_result and isinstance(raw_result['content'], list):
-                    for item in raw_result['content']:
-                        if isinstance(item, dict) and item.get('type') == 'text' and 'text' in item:
-                            extracted_text += item['text']
-                # Case 2: Result is an object with a 'content' list (if mcp library wraps dicts)
-                elif hasattr(raw_result, 'content') and isinstance(raw_result.content, list):
-                    for item in raw_result.content:
-                        if hasattr(item, 'type') and item.type == 'text' and hasattr(item, 'text'):
-                            extracted_text += item.text
-                # Case 3: Result is a direct string (less common for complex tool outputs)
-                elif isinstance(raw_result, str):
-                    extracted_text = raw_result
-                # Fallback: If it's an object with a 'text' attribute
-                elif hasattr(raw_result, 'text'):
-                    extracted_text = str(raw_result.text)
-                # Last resort: Convert the whole raw result to string
-                else:
-                    extracted_text = str(raw_result)
-
-                if extracted_text:
-                    return extracted_text.strip()
-                else:
-                    return "No discernible summary text found in the tool's response."
+        for attempt in range(2):
+            session = await connection.get_session()
+            try:
+                raw_result = await session.call_tool(
+                    "summarize_wikipedia_article",
+                    arguments={"url": article_url},
+                    progress_callback=on_progress,
+                )
+                break
+            except Exception as e:
+                if attempt or not _is_connection_lost(e):
+                    raise
+                # The SSE connection went stale (e.g. dropped by the server); reconnect once and retry
+                await connection.reset(stale=session)
+
+        # --- Logic to Extract Plain Text from MCP Result ---
+        extracted_text = ""
+        
+        # Case 1: Result is a dictionary with a 'content' list (common for Gemini tool output)
+        if isinstance(raw_result, dict) and 'content' in raw_result and isinstance(raw_result['content'], list):
+            for item in raw_result['content']:
+                if isinstance(item, dict) and item.get('type') == 'text' and 'text' in item:
+                    extracted_text += item['text']
+        # Case 2: Result is an object with a 'content' list (if mcp library wraps dicts)
+        elif hasattr(raw_result, 'content') and isinstance(raw_result.content, list):
+            for item in raw_result.content:
+                if hasattr(item, 'type') and item.type == 'text' and hasattr(item, 'text'):
+                    extracted_text += item.text
+        # Case 3: Result is a direct string (less common for complex tool outputs)
+        elif isinstance(raw_result, str):
+            extracted_text = raw_result
+        # Fallback: If it's an object with a 'text' attribute
+        elif hasattr(raw_result, 'text'):
+            extracted_text = str(raw_result.text)
+        # Last resort: Convert the whole raw result to string
+        else:
+            extracted_text = str(raw_result)
+
+        if extracted_text:
+            return extracted_text.strip()
+        else:
+            return "No discernible summary text found in the tool's response."
 
     except Exception as e:
-        error_message = f"An error occurred during tool call: {e}"
-        st.exception(e) # Display full exception in Streamlit
-        return f"{error_message}\n{traceback.format_exc()}"
+        # Re-raise so a failed call is reported by the caller and never cached as a summary
+        raise RuntimeError(f"An error occurred during tool call: {e}") from e
+
+async def call_tools(connection: McpConnection, article_urls: List[str], on_result: Callable[[str, Union[str, Exception]], None]) -> None:
+    """
+    Summarizes several articles concurrently over the shared MCP session, at
+    most MAX_CONCURRENT_CALLS at a time, and calls on_result with each URL and
+    its summary (or the exception it raised) as soon as that call completes.
+    Gemini pacing is left to the server's rate limiter.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+
+    async def one(article_url: str) -> Tuple[str, Union[str, Exception]]:
+        async with semaphore:
+            try:
+                return article_url, await call_tool(connection, article_url)
+            except Exception as e:
+                return article_url, e
+
+    # Owned here so a cancelled batch (e.g. on timeout) also cancels the calls still running
+    tasks = [asyncio.create_task(one(url)) for url in article_urls]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            article_url, result = await next_done
+            on_result(article_url, result)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _drain(future: concurrent.futures.Future, items: queue.Queue, timeout: float) -> Iterator:
+    """
+    Yield items queued by a coroutine running on the background loop until it
+    finishes, so Streamlit elements are only touched from the script thread.
+    Re-raises the coroutine's exception, or TimeoutError after timeout seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while not (future.done() and items.empty()):
+        if time.monotonic() > deadline:
+            future.cancel()
+            raise TimeoutError(f"No summary received within {timeout:g} seconds.")
+        try:
+            yield items.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    future.result(timeout=0)
+
+def summarize(article_url: str, on_text: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Summarize an article through the MCP server, caching the result per URL so
+    reruns and repeat requests return without contacting the server. On a
+    cache miss, on_text is called with each streamed chunk of the summary.
+    """
+    cache = get_summary_cache()
+    summary = cache.get(article_url)
+    if summary is not None:
+        return summary
+
+    connection = get_connection(MCP_SERVER_SSE_URL)
+    st.info(f"Calling tool 'summarize_wikipedia_article' for URL: {article_url}")
+
+    chunks: "queue.Queue[str]" = queue.Queue()
+    future = connection.submit(call_tool(connection, article_url, on_text=chunks.put))
+    for text in _drain(future, chunks, TOOL_CALL_TIMEOUT):
+        if on_text is not None:
+            on_text(text)
+
+    summary = future.result(timeout=0)
+    st.success("Tool call completed.")
+    # Only successful calls reach this point, so failures are never cached
+    cache.set(article_url, summary)
+    return summary
+
+def summarize_batch(article_urls: List[str]) -> Iterator[Tuple[str, Union[str, Exception]]]:
+    """
+    Summarize several articles concurrently, yielding (url, summary or exception)
+    in completion order. Cached summaries are yielded first without a tool call.
+    """
+    cache = get_summary_cache()
+    pending = []
+    for article_url in article_urls:
+        summary = cache.get(article_url)
+        if summary is None:
+            pending.append(article_url)
+        else:
+            yield article_url, summary
+    if not pending:
+        return
+
+    connection = get_connection(MCP_SERVER_SSE_URL)
+    results: "queue.Queue[Tuple[str, Union[str, Exception]]]" = queue.Queue()
+    future = connection.submit(call_tools(connection, pending, lambda url, result: results.put((url, result))))
+
+    # Each round of MAX_CONCURRENT_CALLS calls gets the single-call timeout
+    timeout = TOOL_CALL_TIMEOUT * math.ceil(len(pending) / MAX_CONCURRENT_CALLS)
+    for article_url, result in _drain(future, results, timeout):
+        if not isinstance(result, Exception):
+            cache.set(article_url, result)
+        yield article_url, result
 
 def main():
     st.set_page_config(page_title="Wikipedia Article Summarizer (MCP Client)", page_icon="📝")
@@ -72,24 +378,50 @@ def main():
     # --- Removed Server Configuration Display ---
 
     st.subheader("Article Input")
-    article_url = st.text_input(
-        "Enter Wikipedia Article URL:",
+    article_urls_text = st.text_area(
+        "Enter Wikipedia Article URLs (one per line):",
         "https://en.wikipedia.org/wiki/India", # Default URL for convenience
         placeholder="e.g., https://en.wikipedia.org/wiki/Artificial_intelligence"
     )
+    # Drop blank lines and duplicates, keeping the order the URLs were entered in
+    article_urls = list(dict.fromkeys(url.strip() for url in article_urls_text.splitlines() if url.strip()))
 
     if st.button("Summarize Article"):
-        if article_url:
+        if len(article_urls) == 1:
+            article_url = article_urls[0]
             with st.spinner("Connecting to server and summarizing article..."):
                 try:
-                    # Run the async function
-                    summary_result = asyncio.run(call_tool(MCP_SERVER_SSE_URL, article_url))
-                    
                     st.subheader("Article Summary:")
+                    # Render summary chunks as the server streams them
+                    live_summary = st.empty()
+                    streamed = []
+
+                    def show_chunk(text: str) -> None:
+                        streamed.append(text)
+                        live_summary.markdown("".join(streamed))
+
+                    # Cached per URL; chunks are only streamed when the server is actually called
+                    summary_result = summarize(article_url, on_text=show_chunk)
+
+                    live_summary.empty()
                     st.text_area("Summary", summary_result, height=400)
                 except Exception as e:
                     st.error(f"Failed to get summary: {e}")
                     st.exception(e) # Show full traceback in Streamlit
+        elif article_urls:
+            with st.spinner(f"Connecting to server and summarizing {len(article_urls)} articles..."):
+                try:
+                    st.subheader("Article Summaries:")
+                    # Summaries are shown in the order they finish, not the order entered
+                    for article_url, result in summarize_batch(article_urls):
+                        with st.expander(article_url, expanded=True):
+                            if isinstance(result, Exception):
+                                st.error(f"Failed to get summary: {result}")
+                            else:
+                                st.text_area("Summary", result, height=300, key=f"summary-{article_url}")
+                except Exception as e:
+                    st.error(f"Failed to get summaries: {e}")
+                    st.exception(e) # Show full traceback in Streamlit
         else:
             st.warning("Please enter a URL to summarize.")
 
@@ -0,0 +1,108 @@
+import asyncio
+import socket
+import threading
+import time
+
+import anyio
+import pytest
+import uvicorn
+from mcp.server.fastmcp import FastMCP
+
+import streamlit_new
+
+TOOL_SECONDS = 2.0
+DROP_AFTER = 0.7
+CALLS = 8
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _dropping_sse_app(streams_opened: list):
+    """
+    A FastMCP SSE app whose first SSE stream is cut DROP_AFTER seconds in,
+    like a proxy or Cloud Run ending a long-lived request.
+    """
+    server = FastMCP("test")
+
+    @server.tool()
+    async def summarize_wikipedia_article(url: str) -> str:
+        await asyncio.sleep(TOOL_SECONDS)
+        return f"summary of {url}"
+
+    app = server.sse_app()
+
+    async def dropping_app(scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/sse":
+            streams_opened.append(time.monotonic())
+            if len(streams_opened) == 1:
+                with anyio.move_on_after(DROP_AFTER):
+                    await app(scope, receive, send)
+                return
+        await app(scope, receive, send)
+
+    return dropping_app
+
+
+@pytest.fixture
+def sse_url():
+    streams_opened = []
+    port = _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(_dropping_sse_app(streams_opened), host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}/sse", streams_opened
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+
+
+def test_calls_in_flight_survive_a_dropped_stream(sse_url, loop):
+    url, streams_opened = sse_url
+    connection = streamlit_new.McpConnection(url, loop)
+
+    async def run_calls():
+        return await asyncio.gather(
+            *(streamlit_new.call_tool(connection, f"https://en.wikipedia.org/wiki/{i}") for i in range(CALLS))
+        )
+
+    started = time.monotonic()
+    results = connection.submit(run_calls()).result(timeout=TOOL_SECONDS * 3 + 5)
+    elapsed = time.monotonic() - started
+
+    assert results == [f"summary of https://en.wikipedia.org/wiki/{i}" for i in range(CALLS)]
+    # One reconnect shared by every call, and no call waited for a tool-call timeout
+    assert len(streams_opened) == 2
+    assert elapsed < DROP_AFTER + TOOL_SECONDS * 2
+    connection.submit(connection.reset()).result(timeout=5)
+
+
+def test_dropped_idle_session_reconnects(sse_url, loop):
+    url, streams_opened = sse_url
+    connection = streamlit_new.McpConnection(url, loop)
+
+    first = connection.submit(connection.get_session()).result(timeout=5)
+    time.sleep(DROP_AFTER + 0.5)
+    assert not connection.is_alive()
+
+    result = connection.submit(streamlit_new.call_tool(connection, "https://en.wikipedia.org/wiki/A")).result(timeout=10)
+    assert result == "summary of https://en.wikipedia.org/wiki/A"
+    assert connection.session is not first
+    assert len(streams_opened) == 2
+    connection.submit(connection.reset()).result(timeout=5)